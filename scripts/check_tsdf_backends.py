@@ -0,0 +1,58 @@
+"""
+Check that the CPU and GPU TSDF backends agree on a rendered scene.
+"""
+
+import argparse
+import sys
+
+import numpy as np
+
+from vgn.perception import *
+from vgn.simulation import ClutterRemovalSim
+
+
+def main(args):
+    if tsdf_device() == "CPU:0":
+        print("No CUDA device with Open3D tensor support found, nothing to compare")
+        return 0
+
+    sim = ClutterRemovalSim(args.scene, args.object_set, gui=False, seed=args.seed)
+    sim.reset(args.num_objects)
+
+    # rendering does not alter the scene, both backends see the same images
+    sim.tsdf_device = "CPU:0"
+    cpu_tsdf, cpu_cloud, _ = sim.acquire_tsdf(n=args.num_views)
+    sim.tsdf_device = "CUDA:0"
+    gpu_tsdf, gpu_cloud, _ = sim.acquire_tsdf(n=args.num_views)
+
+    # compare the grids fed to the network
+    diff = np.abs(cpu_tsdf.get_grid() - gpu_tsdf.get_grid())
+    mismatch = np.mean(diff > args.grid_tol)
+    msg = "Grid: max difference {:.4f}, mismatching voxels {:.2%}"
+    print(msg.format(diff.max(), mismatch))
+
+    # compare the high resolution clouds used for sampling grasps
+    d1 = np.asarray(cpu_cloud.compute_point_cloud_distance(gpu_cloud))
+    d2 = np.asarray(gpu_cloud.compute_point_cloud_distance(cpu_cloud))
+    cloud_dist = max(d1.mean(), d2.mean()) if len(d1) and len(d2) else np.inf
+    voxel_size = sim.size / 120
+    msg = "Cloud: {} vs {} points, mean distance {:.5f} m (voxel size {:.5f} m)"
+    num_cpu, num_gpu = len(cpu_cloud.points), len(gpu_cloud.points)
+    print(msg.format(num_cpu, num_gpu, cloud_dist, voxel_size))
+
+    ok = mismatch <= args.max_mismatch and cloud_dist <= voxel_size
+    print("Backends agree" if ok else "Backends differ")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scene", type=str, choices=["pile", "packed"], default="pile")
+    parser.add_argument("--object-set", type=str, default="blocks")
+    parser.add_argument("--num-objects", type=int, default=5)
+    parser.add_argument("--num-views", type=int, default=6)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--grid-tol", type=float, default=0.05)
+    parser.add_argument("--max-mismatch", type=float, default=0.01)
+    args = parser.parse_args()
+    sys.exit(main(args))
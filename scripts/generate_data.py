@@ -1,16 +1,23 @@
 import argparse
+from concurrent.futures import ThreadPoolExecutor
+import multiprocessing
+import os
 from pathlib import Path
 
-from mpi4py import MPI
 import numpy as np
 import open3d as o3d
-import scipy.signal as signal
 from tqdm import tqdm
 
 from vgn.grasp import Grasp, Label
 from vgn.io import *
 from vgn.perception import *
 from vgn.simulation import ClutterRemovalSim
+from vgn.utils._numba_kernels import (
+    build_grasp_frame,
+    sample_points,
+    seed,
+    widest_run_center,
+)
 from vgn.utils.transform import Rotation, Transform
 
 
@@ -18,74 +25,148 @@ OBJECT_COUNT_LAMBDA = 4
 MAX_VIEWPOINT_COUNT = 6
 GRASPS_PER_SCENE = 120
 
+sim = None  # simulation of the current process, see init_worker
+
 
 def main(args):
-    workers, rank = setup_mpi()
-    sim = ClutterRemovalSim(args.scene, args.object_set, gui=args.sim_gui)
-    finger_depth = sim.gripper.finger_depth
-    grasps_per_worker = args.num_grasps // workers
-    pbar = tqdm(total=grasps_per_worker, disable=rank != 0)
+    comm, workers, rank = setup_mpi()
+    num_scenes = args.num_grasps // workers // GRASPS_PER_SCENE
+    if args.num_proc:
+        num_proc = args.num_proc
+    elif args.tsdf_device.upper().startswith("CUDA"):
+        num_proc = 1  # every process would hold its own CUDA context and volumes
+    else:
+        num_proc = max(1, os.cpu_count() // workers)
+    num_proc = 1 if args.sim_gui else num_proc  # only one GUI can be opened
+
+    if num_proc == 1:
+        init_worker(args.scene, args.object_set, args.sim_gui, args.tsdf_device)
 
     if rank == 0:
+        setup_sim = sim or ClutterRemovalSim(args.scene, args.object_set, gui=False)
         (args.root / "scenes").mkdir(parents=True, exist_ok=True)
         write_setup(
             args.root,
-            sim.size,
-            sim.camera.intrinsic,
-            sim.gripper.max_opening_width,
-            sim.gripper.finger_depth,
+            setup_sim.size,
+            setup_sim.camera.intrinsic,
+            setup_sim.gripper.max_opening_width,
+            setup_sim.gripper.finger_depth,
         )
-
-    for _ in range(grasps_per_worker // GRASPS_PER_SCENE):
-        # generate heap
-        object_count = np.random.poisson(OBJECT_COUNT_LAMBDA) + 1
-        sim.reset(object_count)
-        sim.save_state()
-
-        # render synthetic depth images
-        n = np.random.randint(MAX_VIEWPOINT_COUNT) + 1
-        depth_imgs, extrinsics = render_images(sim, n)
-
-        # reconstrct point cloud using a subset of the images
-        tsdf = create_tsdf(sim.size, 120, depth_imgs, sim.camera.intrinsic, extrinsics)
-        pc = tsdf.get_cloud()
-
-        # crop surface and borders from point cloud
-        bounding_box = o3d.geometry.AxisAlignedBoundingBox(sim.lower, sim.upper)
-        pc = pc.crop(bounding_box)
-        # o3d.visualization.draw_geometries([pc])
-
-        if pc.is_empty():
-            print("Point cloud empty, skipping scene")
+        if setup_sim is not sim:
+            setup_sim.world.close()
+        create_grasps_csv(args.root)
+    comm.Barrier()  # other ranks must not create the grasps file themselves
+
+    if num_proc > 1:
+        # spawn fresh processes so that each one gets its own RNG and CUDA state
+        ctx = multiprocessing.get_context("spawn")
+        worker_args = (args.scene, args.object_set, False, args.tsdf_device)
+        pool = ctx.Pool(num_proc, init_worker, worker_args)
+        scenes = pool.imap_unordered(generate_scene, range(num_scenes))
+    else:
+        scenes = map(generate_scene, range(num_scenes))
+
+    # samples are written from this process only, overlapping with the simulation
+    pbar = tqdm(total=num_scenes * GRASPS_PER_SCENE, disable=rank != 0)
+    writer = ThreadPoolExecutor(max_workers=1)
+    pending = None
+    for scene in scenes:
+        if scene is None:
             continue
+        if pending is not None:
+            pending.result()
+        pending = writer.submit(write_scene, args.root, *scene)
+        pbar.update(GRASPS_PER_SCENE)
+
+    if pending is not None:
+        pending.result()
+    writer.shutdown()
+    pbar.close()
+    if num_proc > 1:
+        pool.close()
+        pool.join()
 
-        # store the raw data
-        scene_id = write_sensor_data(args.root, depth_imgs, extrinsics)
 
-        for _ in range(GRASPS_PER_SCENE):
-            # sample and evaluate a grasp point
-            point, normal = sample_grasp_point(pc, finger_depth)
-            grasp, label = evaluate_grasp_point(sim, point, normal)
+def init_worker(scene, object_set, sim_gui, tsdf_device):
+    global sim
+    sim = ClutterRemovalSim(scene, object_set, gui=sim_gui, tsdf_device=tsdf_device)
+    # grasp points are sampled in compiled code, derive its seed from NumPy's state
+    seed(np.random.randint(2 ** 31))
 
-            # store the sample
-            write_grasp(args.root, scene_id, grasp, label)
-            pbar.update()
 
-    pbar.close()
+def generate_scene(_):
+    finger_depth = sim.gripper.finger_depth
+
+    # generate heap
+    object_count = np.random.poisson(OBJECT_COUNT_LAMBDA) + 1
+    sim.reset(object_count)
+    sim.save_state()
+
+    # render synthetic depth images
+    n = np.random.randint(MAX_VIEWPOINT_COUNT) + 1
+    depth_imgs, extrinsics = render_images(sim, n)
+
+    # reconstrct point cloud using a subset of the images
+    tsdf = create_tsdf(
+        sim.size,
+        120,
+        depth_imgs,
+        sim.camera.intrinsic,
+        extrinsics,
+        sim.tsdf_device,
+    )
+    pc = tsdf.get_cloud()
+
+    # crop surface and borders from point cloud
+    bounding_box = o3d.geometry.AxisAlignedBoundingBox(sim.lower, sim.upper)
+    pc = pc.crop(bounding_box)
+    # o3d.visualization.draw_geometries([pc])
+
+    if pc.is_empty():
+        print("Point cloud empty, skipping scene")
+        return None
+
+    # sample all grasp points of the scene up front
+    points, normals = np.asarray(pc.points), np.asarray(pc.normals)
+    points, normals, ok = sample_grasp_points(
+        points, normals, finger_depth, GRASPS_PER_SCENE
+    )
+    if not ok:
+        print("No upwards pointing normals, skipping scene")
+        return None
+
+    # evaluated grasps are stored as a structure of arrays
+    quats = np.empty((GRASPS_PER_SCENE, 4))
+    widths = np.empty(GRASPS_PER_SCENE)
+    labels = np.empty(GRASPS_PER_SCENE, dtype=np.int8)
+    for i, (point, normal) in enumerate(zip(points, normals)):
+        # evaluate a grasp point
+        grasp, labels[i] = evaluate_grasp_point(sim, point, normal)
+        quats[i] = grasp.pose.rotation.as_quat()
+        widths[i] = grasp.width
+
+    return depth_imgs, extrinsics, (quats, points, widths, labels)
+
+
+def write_scene(root, depth_imgs, extrinsics, grasps):
+    scene_id = write_sensor_data(root, depth_imgs, extrinsics)
+    write_grasps(root, scene_id, *grasps)
 
 
 def setup_mpi():
-    workers = MPI.COMM_WORLD.Get_size()
-    rank = MPI.COMM_WORLD.Get_rank()
-    return workers, rank
+    # imported here, the spawned pool workers re-import this script and must not
+    # initialize MPI a second time
+    from mpi4py import MPI
+
+    comm = MPI.COMM_WORLD
+    return comm, comm.Get_size(), comm.Get_rank()
 
 
 def render_images(sim, n):
-    height, width = sim.camera.intrinsic.height, sim.camera.intrinsic.width
     origin = Transform(Rotation.identity(), np.r_[sim.size / 2, sim.size / 2, 0.0])
 
     extrinsics = np.empty((n, 7), np.float32)
-    depth_imgs = np.empty((n, height, width), np.float32)
+    views = []
 
     for i in range(n):
         r = np.random.uniform(1.6, 2.4) * sim.size
@@ -93,61 +174,40 @@ def render_images(sim, n):
         phi = np.random.uniform(0.0, 2.0 * np.pi)
 
         extrinsic = camera_on_sphere(origin, r, theta, phi)
-        depth_img = sim.camera.render(extrinsic)[1]
-
         extrinsics[i] = extrinsic.to_list()
-        depth_imgs[i] = depth_img
+        views.append(extrinsic)
+
+    # render all viewpoints back-to-back
+    depth_imgs = sim.camera.render_depth_images(views)
 
     return depth_imgs, extrinsics
 
 
-def sample_grasp_point(point_cloud, finger_depth, eps=0.1):
-    points = np.asarray(point_cloud.points)
-    normals = np.asarray(point_cloud.normals)
-    ok = False
-    while not ok:
-        # TODO this could result in an infinite loop, though very unlikely
-        idx = np.random.randint(len(points))
-        point, normal = points[idx], normals[idx]
-        ok = normal[2] > -0.1  # make sure the normal is poitning upwards
-    grasp_depth = np.random.uniform(-eps * finger_depth, (1.0 + eps) * finger_depth)
-    point = point + normal * grasp_depth
-    return point, normal
+def sample_grasp_points(points, normals, finger_depth, count, eps=0.1):
+    return sample_points(points, normals, finger_depth, eps, count)
 
 
 def evaluate_grasp_point(sim, pos, normal, num_rotations=6):
     # define initial grasp frame on object surface
-    z_axis = -normal
-    x_axis = np.r_[1.0, 0.0, 0.0]
-    if np.isclose(np.abs(np.dot(x_axis, z_axis)), 1.0, 1e-4):
-        x_axis = np.r_[0.0, 1.0, 0.0]
-    y_axis = np.cross(z_axis, x_axis)
-    x_axis = np.cross(y_axis, z_axis)
-    R = Rotation.from_matrix(np.vstack((x_axis, y_axis, z_axis)).T)
+    R = Rotation.from_matrix(build_grasp_frame(normal))
 
     # try to grasp with different yaw angles
     yaws = np.linspace(0.0, np.pi, num_rotations)
-    outcomes, widths = [], []
-    for yaw in yaws:
-        ori = R * Rotation.from_euler("z", yaw)
-        sim.restore_state()
-        candidate = Grasp(Transform(ori, pos), width=sim.gripper.max_opening_width)
-        outcome, width = sim.execute_grasp(candidate, remove=False)
-        outcomes.append(outcome)
-        widths.append(width)
+    oris = R * Rotation.from_euler("z", yaws)
+    candidates = [
+        Grasp(Transform(oris[i], pos), width=sim.gripper.max_opening_width)
+        for i in range(num_rotations)
+    ]
+    outcomes, widths = sim.execute_grasps(candidates)
 
     # detect mid-point of widest peak of successful yaw angles
     # TODO currently this does not properly handle periodicity
-    successes = (np.asarray(outcomes) == Label.SUCCESS).astype(float)
-    if np.sum(successes):
-        peaks, properties = signal.find_peaks(
-            x=np.r_[0, successes, 0], height=1, width=1
-        )
-        idx_of_widest_peak = peaks[np.argmax(properties["widths"])] - 1
-        ori = R * Rotation.from_euler("z", yaws[idx_of_widest_peak])
-        width = widths[idx_of_widest_peak]
+    successes = outcomes == Label.SUCCESS
+    idx_of_widest_peak = widest_run_center(successes)  # -1 if all attempts failed
+    ori, width = oris[idx_of_widest_peak], widths[idx_of_widest_peak]
+    label = Label.SUCCESS if idx_of_widest_peak >= 0 else Label.FAILURE
 
-    return Grasp(Transform(ori, pos), width), int(np.max(outcomes))
+    return Grasp(Transform(ori, pos), width), int(label)
 
 
 if __name__ == "__main__":
@@ -156,6 +216,8 @@ if __name__ == "__main__":
     parser.add_argument("--scene", type=str, choices=["pile", "packed"], default="pile")
     parser.add_argument("--object-set", type=str, default="blocks")
     parser.add_argument("--num-grasps", type=int, default=10000)
+    parser.add_argument("--num-proc", type=int, help="processes per MPI worker")
     parser.add_argument("--sim-gui", action="store_true")
+    parser.add_argument("--tsdf-device", type=str, default="CPU:0")
     args = parser.parse_args()
     main(args)
@@ -8,7 +8,6 @@ import argparse
 from pathlib import Path
 import time
 
-import cv_bridge
 import numpy as np
 import rospy
 import sensor_msgs.msg
@@ -39,60 +38,126 @@ class GraspDetectionServer(object):
         # define camera parameters
         self.cam_topic_name = "/camera/depth/image_rect_raw"
         self.intrinsic = CameraIntrinsic(640, 480, 383.265, 383.26, 319.39, 242.43)
-
-        # setup a CV bridge
-        self.cv_bridge = cv_bridge.CvBridge()
+        self.tsdf = TSDFVolume(0.3, 40, tsdf_device())
 
         # construct the grasp planner object
         self.device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
         self.net = load_network(model_path, self.device)
+        if self.device.type == "cuda" and hasattr(torch, "compile"):
+            self.net = torch.compile(self.net, mode="reduce-overhead")
+
+            # warm up the network before the first frame arrives, the first calls
+            # compile the graph and a later one records the CUDA graph
+            with torch.inference_mode():
+                for _ in range(3):
+                    self.net(torch.zeros(1, 1, 40, 40, 40, device=self.device))
+            torch.cuda.synchronize()
+
+        # on the GPU, the forward pass of a frame is queued before the previous frame
+        # is filtered, the input buffers alternate between consecutive frames
+        self.pipelined = self.device.type == "cuda"
+        if self.pipelined:
+            self.h2d_stream = torch.cuda.Stream()
+            self.compute_stream = torch.cuda.Stream()
+            shape = (1, 1, 40, 40, 40)
+            self.tsdf_host = [torch.empty(shape, pin_memory=True) for _ in range(2)]
+            self.tsdf_dev = [torch.empty(shape, device=self.device) for _ in range(2)]
+            self.buffer_idx = 0
+            self.pending = None
 
         # initialize the visualization
         vis.clear()
         vis.draw_workspace(0.3)
 
-        # subscribe to the camera
+        # subscribe to the camera, the buffer must hold an entire depth image
         self.img = None
-        rospy.Subscriber(self.cam_topic_name, sensor_msgs.msg.Image, self.sensor_cb)
+        self.busy = False
+        rospy.Subscriber(
+            self.cam_topic_name,
+            sensor_msgs.msg.Image,
+            self.sensor_cb,
+            queue_size=1,
+            buff_size=2 ** 24,
+            tcp_nodelay=True,
+        )
 
         # setup cb to detect grasps
         rospy.Timer(rospy.Duration(0.1), self.detect_grasps)
 
     def sensor_cb(self, msg):
-        self.img = self.cv_bridge.imgmsg_to_cv2(msg).astype(np.float32) * 0.001
+        if self.busy:
+            return  # drop frames while a detection is running
+        self.img = ros_utils.from_depth_img_msg(msg)
 
     def detect_grasps(self, _):
         if self.img is None:
+            # no new image, show the last launched frame instead of holding it
+            if self.pipelined and self.pending is not None:
+                self.busy = True
+                try:
+                    self.show_prediction(self.pending)
+                finally:
+                    self.busy = False
             return
 
+        self.busy = True
+        try:
+            self.run_detection(self.img)
+        finally:
+            self.img = None
+            self.busy = False
+
+    def run_detection(self, img):
         tic = time.time()
-        self.tsdf = TSDFVolume(0.3, 40)
-        self.tsdf.integrate(self.img, self.intrinsic, self.T_cam_task)
+        self.tsdf.reset()
+        self.tsdf.integrate(img, self.intrinsic, self.T_cam_task)
         print("Construct tsdf ", time.time() - tic)
 
         tic = time.time()
         tsdf_vol = self.tsdf.get_grid()
-        voxel_size = self.tsdf.voxel_size
         print("Extract grid  ", time.time() - tic)
 
+        if self.pipelined:
+            tic = time.time()
+            previous = self.pending
+            self.launch_prediction(tsdf_vol)
+            print("Launch forward pass ", time.time() - tic)
+            if previous is not None:
+                self.show_prediction(previous)
+            return
+
         tic = time.time()
         qual_vol, rot_vol, width_vol = predict(tsdf_vol, self.net, self.device)
         print("Forward pass   ", time.time() - tic)
 
         tic = time.time()
         qual_vol, rot_vol, width_vol = process(tsdf_vol, qual_vol, rot_vol, width_vol)
-        print("Filter         ", time.time() - tic)
+        grasps, scores = select(qual_vol.copy(), rot_vol, width_vol, 0.90, 1)
+        print("Filter and select ", time.time() - tic)
 
-        vis.draw_quality(qual_vol, voxel_size, threshold=0.01)
+        self.visualize(qual_vol, grasps, scores)
 
+    def show_prediction(self, pending):
+        """Filter and visualize a frame whose forward pass has been launched."""
         tic = time.time()
-        grasps, scores = select(qual_vol, rot_vol, width_vol, 0.90, 1)
+        tsdf_dev, outputs = self.collect_prediction(pending)
+        grasps, scores, qual_vol = process_and_select(
+            tsdf_dev, *outputs, threshold=0.90, max_filter_size=1
+        )
+        qual_vol = qual_vol.cpu().numpy()
+        print("Wait, filter and select ", time.time() - tic)
+
+        self.visualize(qual_vol, grasps, scores)
+
+    def visualize(self, qual_vol, grasps, scores):
+        voxel_size = self.tsdf.voxel_size
+        vis.draw_quality(qual_vol, voxel_size, threshold=0.01)
+
         num_grasps = len(grasps)
         if num_grasps > 0:
             idx = np.random.choice(num_grasps, size=min(5, num_grasps), replace=False)
             grasps, scores = np.array(grasps)[idx], np.array(scores)[idx]
         grasps = [from_voxel_coordinates(g, voxel_size) for g in grasps]
-        print("Select grasps  ", time.time() - tic)
 
         vis.clear_grasps()
         rospy.sleep(0.01)
@@ -100,9 +165,33 @@ class GraspDetectionServer(object):
         vis.draw_grasps(grasps, scores, 0.05)
         print("Visualize      ", time.time() - tic)
 
-        self.img = None
         print()
 
+    def launch_prediction(self, tsdf_vol):
+        """Enqueue the forward pass of a frame without waiting for its result."""
+        # the buffers were last used two frames ago, that frame has been collected
+        tsdf_host = self.tsdf_host[self.buffer_idx]
+        tsdf_dev = self.tsdf_dev[self.buffer_idx]
+        self.buffer_idx ^= 1
+
+        tsdf_host.copy_(torch.from_numpy(tsdf_vol).unsqueeze(0))
+        with torch.cuda.stream(self.h2d_stream):
+            tsdf_dev.copy_(tsdf_host, non_blocking=True)
+        self.compute_stream.wait_stream(self.h2d_stream)
+        with torch.cuda.stream(self.compute_stream), torch.inference_mode():
+            # the outputs of a CUDA graph are overwritten by its next replay
+            outputs = tuple(out.clone() for out in self.net(tsdf_dev))
+        done = torch.cuda.Event()
+        done.record(self.compute_stream)
+        self.pending = (tsdf_dev, outputs, done)
+
+    def collect_prediction(self, pending):
+        """Wait for a launched forward pass and return its input and outputs."""
+        tsdf_dev, outputs, done = pending
+        done.synchronize()
+        if self.pending is pending:
+            self.pending = None
+        return tsdf_dev, outputs
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
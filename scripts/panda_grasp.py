@@ -7,7 +7,6 @@ Open-loop grasp execution using a Panda arm and wrist-mounted RealSense camera.
 import argparse
 from pathlib import Path
 
-import cv_bridge
 import franka_msgs.msg
 import geometry_msgs.msg
 import numpy as np
@@ -216,20 +215,27 @@ class TSDFServer(object):
         self.intrinsic = CameraIntrinsic.from_dict(rospy.get_param("~cam/intrinsic"))
         self.size = 6.0 * rospy.get_param("~finger_depth")
 
-        self.cv_bridge = cv_bridge.CvBridge()
         self.tf_tree = ros_utils.TransformTree()
+        self.low_res_tsdf = TSDFVolume(self.size, 40)
+        self.high_res_tsdf = TSDFVolume(self.size, 120)
         self.integrate = False
-        rospy.Subscriber(self.cam_topic_name, sensor_msgs.msg.Image, self.sensor_cb)
+        rospy.Subscriber(
+            self.cam_topic_name,
+            sensor_msgs.msg.Image,
+            self.sensor_cb,
+            buff_size=2 ** 24,
+            tcp_nodelay=True,
+        )
 
     def reset(self):
-        self.low_res_tsdf = TSDFVolume(self.size, 40)
-        self.high_res_tsdf = TSDFVolume(self.size, 120)
+        self.low_res_tsdf.reset()
+        self.high_res_tsdf.reset()
 
     def sensor_cb(self, msg):
         if not self.integrate:
             return
 
-        img = self.cv_bridge.imgmsg_to_cv2(msg).astype(np.float32) * 0.001
+        img = ros_utils.from_depth_img_msg(msg)
         T_cam_task = self.tf_tree.lookup(
             self.cam_frame_id, "task", msg.header.stamp, rospy.Duration(0.1)
         )
@@ -6,6 +6,9 @@ from vgn.io import *
 from vgn.perception import *
 from vgn.utils.transform import Rotation, Transform
 
+# rotation by pi around the z-axis as (x, y, z, w) quaternion
+_YAW_FLIP_QUAT = np.array([0.0, 0.0, 1.0, 0.0])
+
 
 class Dataset(torch.utils.data.Dataset):
     def __init__(self, root, augment=False):
@@ -29,9 +32,8 @@ class Dataset(torch.utils.data.Dataset):
 
         index = np.round(pos).astype(np.long)
         rotations = np.empty((2, 4), dtype=np.single)
-        R = Rotation.from_rotvec(np.pi * np.r_[0.0, 0.0, 1.0])
         rotations[0] = ori.as_quat()
-        rotations[1] = (ori * R).as_quat()
+        rotations[1] = _quat_mul_batch(rotations[0], _YAW_FLIP_QUAT)
 
         x, y, index = voxel_grid, (label, rotations, width), index
 
@@ -60,3 +62,18 @@ def apply_transform(voxel_grid, orientation, position):
     orientation = T.rotation * orientation
 
     return voxel_grid, orientation, position
+
+
+def _quat_mul_batch(q1, q2):
+    """Hamilton product of (x, y, z, w) quaternions, broadcast over leading axes."""
+    x1, y1, z1, w1 = np.moveaxis(np.asarray(q1), -1, 0)
+    x2, y2, z2, w2 = np.moveaxis(np.asarray(q2), -1, 0)
+    return np.stack(
+        [
+            w1 * x2 + x1 * w2 + y1 * z2 - z1 * y2,
+            w1 * y2 - x1 * z2 + y1 * w2 + z1 * x2,
+            w1 * z2 + x1 * y2 - y1 * x2 + z1 * w2,
+            w1 * w2 - x1 * x2 - y1 * y2 - z1 * z2,
+        ],
+        axis=-1,
+    )
@@ -3,6 +3,7 @@ import time
 import numpy as np
 from scipy import ndimage
 import torch
+import torch.nn.functional as F
 
 from vgn import vis
 from vgn.grasp import *
@@ -46,7 +47,7 @@ def predict(tsdf_vol, net, device):
     tsdf_vol = torch.from_numpy(tsdf_vol).unsqueeze(0).to(device)
 
     # forward pass
-    with torch.no_grad():
+    with torch.inference_mode():
         qual_vol, rot_vol, width_vol = net(tsdf_vol)
 
     # move output back to the CPU
@@ -105,6 +106,95 @@ def select(qual_vol, rot_vol, width_vol, threshold=0.90, max_filter_size=4):
     return grasps, scores
 
 
+def process_and_select(
+    tsdf_vol,
+    qual_vol,
+    rot_vol,
+    width_vol,
+    threshold=0.90,
+    max_filter_size=4,
+    gaussian_filter_sigma=1.0,
+    min_width=1.33,
+    max_width=9.33,
+):
+    """Run `process` and `select` on tensors, on the device they are stored on.
+
+    Only the selected grasps leave the device. The processed quality volume is
+    returned as a tensor, e.g. for visualization.
+    """
+    with torch.inference_mode():
+        tsdf_vol = torch.as_tensor(tsdf_vol, device=qual_vol.device).squeeze()
+        qual_vol, rot_vol, width_vol = (
+            qual_vol.squeeze(),
+            rot_vol.squeeze(),
+            width_vol.squeeze(),
+        )
+
+        # smooth quality volume with a Gaussian
+        qual_vol = _gaussian_filter(qual_vol, gaussian_filter_sigma)
+
+        # mask out voxels too far away from the surface
+        outside_voxels = tsdf_vol > 0.5
+        inside_voxels = (1e-3 < tsdf_vol) & (tsdf_vol < 0.5)
+        valid_voxels = outside_voxels
+        for _ in range(2):
+            valid_voxels = _binary_dilation(valid_voxels) & ~inside_voxels
+
+        # reject voxels with predicted widths that are too small or too large
+        invalid = ~valid_voxels | (width_vol < min_width) | (width_vol > max_width)
+        qual_vol = qual_vol.masked_fill(invalid, 0.0)
+
+        # threshold on grasp quality
+        thresholded = qual_vol.masked_fill(qual_vol < threshold, 0.0)
+
+        # non maximum suppression, the window is placed like in ndimage
+        lower = max_filter_size // 2
+        upper = max_filter_size - 1 - lower
+        padded = F.pad(thresholded[None, None], (lower, upper) * 3, value=-np.inf)
+        max_vol = F.max_pool3d(padded, max_filter_size, stride=1)[0, 0]
+        mask = (thresholded == max_vol) & (thresholded > 0.0)
+
+        # construct grasps
+        index = mask.nonzero()
+        i, j, k = index.unbind(1)
+        scores = thresholded[i, j, k].cpu().numpy()
+        quats = rot_vol[:, i, j, k].T.cpu().numpy()
+        widths = width_vol[i, j, k].cpu().numpy()
+        positions = index.cpu().numpy().astype(np.float64)
+
+    grasps = [
+        Grasp(Transform(Rotation.from_quat(quats[n]), positions[n]), widths[n])
+        for n in range(len(positions))
+    ]
+    return grasps, scores, qual_vol
+
+
+def _gaussian_filter(vol, sigma, truncate=4.0):
+    # separable equivalent of ndimage.gaussian_filter with mode="nearest"
+    radius = int(truncate * sigma + 0.5)
+    x = torch.arange(-radius, radius + 1, dtype=vol.dtype, device=vol.device)
+    kernel = torch.exp(-0.5 * (x / sigma) ** 2)
+    kernel = kernel / kernel.sum()
+    vol = vol[None, None]
+    for dim in range(3):
+        shape = [1, 1, 1, 1, 1]
+        shape[2 + dim] = -1
+        padding = [0] * 6
+        padding[4 - 2 * dim] = padding[5 - 2 * dim] = radius
+        vol = F.conv3d(F.pad(vol, padding, mode="replicate"), kernel.view(shape))
+    return vol[0, 0]
+
+
+def _binary_dilation(mask):
+    # dilation with the 6-connected structuring element of ndimage.binary_dilation
+    structure = torch.zeros((1, 1, 3, 3, 3), dtype=torch.float32, device=mask.device)
+    structure[0, 0, 1, 1, :] = 1.0
+    structure[0, 0, 1, :, 1] = 1.0
+    structure[0, 0, :, 1, 1] = 1.0
+    dilated = F.conv3d(mask[None, None].float(), structure, padding=1)
+    return dilated[0, 0] > 0.0
+
+
 def select_index(qual_vol, rot_vol, width_vol, index):
     i, j, k = index
     score = qual_vol[i, j, k]
@@ -41,17 +41,39 @@ def read_sensor_data(root, scene_id):
 
 
 def write_grasp(root, scene_id, grasp, label):
-    # TODO concurrent writes could be an issue
+    quat = grasp.pose.rotation.as_quat()
+    position = grasp.pose.translation
+    write_grasps(root, scene_id, quat[None], position[None], [grasp.width], [label])
+
+
+def create_grasps_csv(root):
+    """Write the header of the grasps file unless it already exists."""
     csv_path = root / "grasps.csv"
     if not csv_path.exists():
         create_csv(
             csv_path,
             ["scene_id", "qx", "qy", "qz", "qw", "x", "y", "z", "width", "label"],
         )
-    qx, qy, qz, qw = grasp.pose.rotation.as_quat()
-    x, y, z = grasp.pose.translation
-    width = grasp.width
-    append_csv(csv_path, scene_id, qx, qy, qz, qw, x, y, z, width, label)
+
+
+def write_grasps(root, scene_id, quats, positions, widths, labels):
+    """Append a batch of grasps given as arrays of shape (N,4), (N,3), (N,) and (N,).
+
+    Concurrent writers must call `create_grasps_csv` once before appending, as
+    creating the file truncates it.
+    """
+    create_grasps_csv(root)
+    csv_path = root / "grasps.csv"
+    df = pd.DataFrame(
+        np.c_[quats, positions, widths],
+        columns=["qx", "qy", "qz", "qw", "x", "y", "z", "width"],
+    )
+    df.insert(0, "scene_id", scene_id)
+    df["label"] = np.asarray(labels, dtype=int)
+    # a single write keeps the rows of concurrent appends from interleaving
+    rows = df.to_csv(header=False, index=False)
+    with csv_path.open("a") as f:
+        f.write(rows)
 
 
 def read_grasp(df, i):
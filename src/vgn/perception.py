@@ -61,19 +61,63 @@ class CameraIntrinsic(object):
 
 
 class TSDFVolume(object):
-    """Integration of multiple depth images using a TSDF."""
+    """Integration of multiple depth images using a TSDF.
 
-    def __init__(self, size, resolution):
+    On a CUDA device (e.g. "CUDA:0"), the volume is backed by Open3D's tensor-based
+    voxel block grid and integration runs on the GPU.
+    """
+
+    def __init__(self, size, resolution, device="CPU:0"):
         self.size = size
         self.resolution = resolution
         self.voxel_size = self.size / self.resolution
         self.sdf_trunc = 4 * self.voxel_size
+        self.device = device
+
+        if self.on_gpu:
+            self._device = o3d.core.Device(device)
+            # only blocks overlapping the workspace are allocated, see _integrate_gpu
+            self._block_resolution = 8
+            self._blocks_per_side = -(-self.resolution // self._block_resolution)
+            self._volume = self._create_voxel_block_grid()
+            # voxels of the block grid are located at integer multiples of the
+            # voxel size, shift them to the voxel centers of the uniform volume
+            self._T_grid_offset = np.eye(4)
+            self._T_grid_offset[:3, 3] = 0.5 * self.voxel_size
+        else:
+            self._volume = o3d.pipelines.integration.UniformTSDFVolume(
+                length=self.size,
+                resolution=self.resolution,
+                sdf_trunc=self.sdf_trunc,
+                color_type=o3d.pipelines.integration.TSDFVolumeColorType.NoColor,
+            )
 
-        self._volume = o3d.pipelines.integration.UniformTSDFVolume(
-            length=self.size,
-            resolution=self.resolution,
-            sdf_trunc=self.sdf_trunc,
-            color_type=o3d.pipelines.integration.TSDFVolumeColorType.NoColor,
+    @property
+    def on_gpu(self):
+        return self.device.upper().startswith("CUDA")
+
+    def reset(self):
+        """Discard all integrated measurements."""
+        if self.on_gpu:
+            # free all blocks of the hash map, their buffer slots are reused by the
+            # next integration, and zero the weights so that stale values in those
+            # slots are overwritten instead of averaged
+            hashmap = self._volume.hashmap()
+            active = hashmap.active_buf_indices().to(o3d.core.int64)
+            hashmap.erase(hashmap.key_tensor()[active])
+            self._volume.attribute("weight")[:] = 0.0
+        else:
+            self._volume.reset()
+
+    def _create_voxel_block_grid(self):
+        return o3d.t.geometry.VoxelBlockGrid(
+            attr_names=("tsdf", "weight"),
+            attr_dtypes=(o3d.core.float32, o3d.core.float32),
+            attr_channels=((1), (1)),
+            voxel_size=self.voxel_size,
+            block_resolution=self._block_resolution,
+            block_count=2 * self._blocks_per_side ** 3,  # margin for the hash map
+            device=self._device,
         )
 
     def integrate(self, depth_img, intrinsic, extrinsic):
@@ -83,6 +127,10 @@ class TSDFVolume(object):
             intrinsic: The intrinsic parameters of a pinhole camera model.
             extrinsics: The transform from the TSDF to camera coordinates, T_eye_task.
         """
+        if self.on_gpu:
+            self._integrate_gpu(depth_img, intrinsic, extrinsic)
+            return
+
         rgbd = o3d.geometry.RGBDImage.create_from_color_and_depth(
             o3d.geometry.Image(np.empty_like(depth_img)),
             o3d.geometry.Image(depth_img),
@@ -104,22 +152,90 @@ class TSDFVolume(object):
 
         self._volume.integrate(rgbd, intrinsic, extrinsic)
 
-    def get_grid(self):
-        cloud = self._volume.extract_voxel_point_cloud()
-        points = np.asarray(cloud.points)
-        distances = np.asarray(cloud.colors)[:, [0]]
-        grid = np.zeros((1, 40, 40, 40), dtype=np.float32)
-        for idx, point in enumerate(points):
-            i, j, k = np.floor(point / self.voxel_size).astype(int)
-            grid[0, i, j, k] = distances[idx]
-        return grid
+    def _integrate_gpu(self, depth_img, intrinsic, extrinsic):
+        depth_img = np.ascontiguousarray(depth_img, dtype=np.float32)
+        depth = o3d.t.geometry.Image(o3d.core.Tensor(depth_img)).to(self._device)
+        intrinsic = o3d.core.Tensor(intrinsic.K, o3d.core.float64)
+        extrinsic = extrinsic.as_matrix() @ self._T_grid_offset
+        depth_max = self._max_workspace_depth(extrinsic)
+        extrinsic = o3d.core.Tensor(extrinsic, o3d.core.float64)
+        kwargs = dict(
+            depth_scale=1.0,
+            depth_max=depth_max,
+            trunc_voxel_multiplier=4.0,
+        )
+
+        # discard the blocks of the view frustum that lie outside the workspace
+        block_coords = self._volume.compute_unique_block_coordinates(
+            depth, intrinsic, extrinsic, **kwargs
+        )
+        block_coords = block_coords.cpu().numpy()
+        inside = np.all(
+            (block_coords >= 0) & (block_coords < self._blocks_per_side), axis=1
+        )
+        if not np.any(inside):
+            return
+        block_coords = o3d.core.Tensor(block_coords[inside]).to(self._device)
+
+        self._volume.integrate(block_coords, depth, intrinsic, extrinsic, **kwargs)
+
+    def _max_workspace_depth(self, extrinsic):
+        # depth of the farthest workspace corner, no need to integrate beyond that
+        corners = np.array(np.meshgrid(*[[0.0, self.size]] * 3)).reshape(3, -1)
+        corners = extrinsic @ np.vstack((corners, np.ones(8)))
+        return min(2.0, float(np.max(corners[2])) + self.sdf_trunc)
+
+    def get_grid(self, out=None):
+        """Return the TSDF as a (1, resolution, resolution, resolution) float32 grid.
+
+        If given, the grid is written into the preallocated array out.
+        """
+        if self.on_gpu:
+            coords, indices = self._volume.voxel_coordinates_and_flattened_indices()
+            tsdf = self._volume.attribute("tsdf").reshape((-1,))[indices]
+            weight = self._volume.attribute("weight").reshape((-1,))[indices]
+            coords, tsdf = coords.cpu().numpy(), tsdf.cpu().numpy()
+            weight = weight.cpu().numpy()
+            # match the voxel point cloud extracted from the uniform volume
+            valid = (weight != 0.0) & (tsdf < 0.98) & (tsdf >= -0.98)
+            indices = np.round(coords[valid] / self.voxel_size).astype(int)
+            distances = 0.5 * (tsdf[valid] + 1.0)
+        else:
+            cloud = self._volume.extract_voxel_point_cloud()
+            points = np.asarray(cloud.points)
+            indices = np.floor(points / self.voxel_size).astype(int)
+            distances = np.asarray(cloud.colors)[:, 0]
+
+        if out is None:
+            out = np.zeros((1,) + (self.resolution,) * 3, dtype=np.float32)
+        else:
+            out.fill(0.0)
+        inside = np.all((indices >= 0) & (indices < self.resolution), axis=1)
+        i, j, k = indices[inside].T
+        out[0, i, j, k] = distances[inside]
+        return out
 
     def get_cloud(self):
+        if self.on_gpu:
+            cloud = self._volume.extract_point_cloud(weight_threshold=0.5)
+            cloud = cloud.to_legacy().translate(self._T_grid_offset[:3, 3])
+            bounding_box = o3d.geometry.AxisAlignedBoundingBox(
+                np.zeros(3), np.full(3, self.size)
+            )
+            return cloud.crop(bounding_box)
         return self._volume.extract_point_cloud()
 
 
-def create_tsdf(size, resolution, depth_imgs, intrinsic, extrinsics):
-    tsdf = TSDFVolume(size, resolution)
+def tsdf_device():
+    """Return the preferred device for TSDF integration."""
+    if hasattr(o3d, "t") and hasattr(o3d.t.geometry, "VoxelBlockGrid"):
+        if o3d.core.cuda.is_available():
+            return "CUDA:0"
+    return "CPU:0"
+
+
+def create_tsdf(size, resolution, depth_imgs, intrinsic, extrinsics, device="CPU:0"):
+    tsdf = TSDFVolume(size, resolution, device)
     for i in range(depth_imgs.shape[0]):
         extrinsic = Transform.from_list(extrinsics[i])
         tsdf.integrate(depth_imgs[i], intrinsic, extrinsic)
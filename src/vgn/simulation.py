@@ -11,7 +11,7 @@ from vgn.utils.transform import Rotation, Transform
 
 
 class ClutterRemovalSim(object):
-    def __init__(self, scene, object_set, gui=True, seed=None):
+    def __init__(self, scene, object_set, gui=True, seed=None, tsdf_device="CPU:0"):
         assert scene in ["pile", "packed"]
 
         self.urdf_root = Path("data/urdfs")
@@ -28,6 +28,7 @@ class ClutterRemovalSim(object):
         self.size = 6 * self.gripper.finger_depth
         intrinsic = CameraIntrinsic(640, 480, 540.0, 540.0, 320.0, 240.0)
         self.camera = self.world.add_camera(intrinsic, 0.1, 2.0)
+        self.tsdf_device = tsdf_device
 
     @property
     def num_objects(self):
@@ -140,8 +141,8 @@ class ClutterRemovalSim(object):
 
         If N is given, the first n viewpoints on a circular trajectory consisting of N points are rendered.
         """
-        tsdf = TSDFVolume(self.size, 40)
-        high_res_tsdf = TSDFVolume(self.size, 120)
+        tsdf = TSDFVolume(self.size, 40, self.tsdf_device)
+        high_res_tsdf = TSDFVolume(self.size, 120, self.tsdf_device)
 
         origin = Transform(Rotation.identity(), np.r_[self.size / 2, self.size / 2, 0])
         r = 2.0 * self.size
@@ -151,9 +152,10 @@ class ClutterRemovalSim(object):
         phi_list = 2.0 * np.pi * np.arange(n) / N
         extrinsics = [camera_on_sphere(origin, r, theta, phi) for phi in phi_list]
 
+        depth_imgs = self.camera.render_depth_images(extrinsics)
+
         timing = 0.0
-        for extrinsic in extrinsics:
-            depth_img = self.camera.render(extrinsic)[1]
+        for depth_img, extrinsic in zip(depth_imgs, extrinsics):
             tic = time.time()
             tsdf.integrate(depth_img, self.camera.intrinsic, extrinsic)
             timing += time.time() - tic
@@ -202,6 +204,21 @@ class ClutterRemovalSim(object):
 
         return result
 
+    def execute_grasps(self, grasps, allow_contact=False):
+        """Execute a batch of grasps, each one starting from the last saved state.
+
+        Returns:
+            Arrays with the outcome and final gripper width of each grasp.
+        """
+        outcomes = np.empty(len(grasps), dtype=np.int64)
+        widths = np.empty(len(grasps), dtype=np.float64)
+        for i, grasp in enumerate(grasps):
+            self.restore_state()
+            outcomes[i], widths[i] = self.execute_grasp(
+                grasp, remove=False, allow_contact=allow_contact
+            )
+        return outcomes, widths
+
     def remove_and_wait(self):
         # wait for objects to rest while removing bodies that fell outside the workspace
         removed_object = True
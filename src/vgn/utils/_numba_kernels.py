@@ -0,0 +1,79 @@
+import numba
+import numpy as np
+
+
+@numba.njit(cache=True)
+def seed(value):
+    """Seed the random number generator of the kernels, it is separate from NumPy's."""
+    np.random.seed(value)
+
+
+@numba.njit(cache=True)
+def sample_point(points, normals, finger_depth, eps, max_tries=1000):
+    """Sample a point with an upwards pointing normal and offset it along the normal.
+
+    The returned flag is False if no such point was found within max_tries draws.
+    """
+    ok, idx = False, 0
+    for _ in range(max_tries):
+        idx = np.random.randint(0, points.shape[0])
+        if normals[idx, 2] > -0.1:  # make sure the normal is poitning upwards
+            ok = True
+            break
+    if not ok:
+        return np.zeros(3), np.zeros(3), False
+    normal = normals[idx].copy()
+    grasp_depth = np.random.uniform(-eps * finger_depth, (1.0 + eps) * finger_depth)
+    point = points[idx] + normal * grasp_depth
+    return point, normal, True
+
+
+@numba.njit(cache=True)
+def build_grasp_frame(normal):
+    """Construct a rotation matrix whose z-axis points against the surface normal."""
+    z_axis = -normal
+    x_axis = np.array([1.0, 0.0, 0.0])
+    if np.abs(np.abs(np.dot(x_axis, z_axis)) - 1.0) <= 1e-8 + 1e-4:
+        x_axis = np.array([0.0, 1.0, 0.0])
+    y_axis = np.cross(z_axis, x_axis)
+    x_axis = np.cross(y_axis, z_axis)
+    R = np.empty((3, 3))
+    R[:, 0] = x_axis
+    R[:, 1] = y_axis
+    R[:, 2] = z_axis
+    return R
+
+
+@numba.njit(cache=True)
+def sample_points(points, normals, finger_depth, eps, count):
+    """Draw a batch of count grasp points, see `sample_point`."""
+    sampled_points = np.empty((count, 3))
+    sampled_normals = np.empty((count, 3))
+    for n in range(count):
+        point, normal, ok = sample_point(points, normals, finger_depth, eps)
+        if not ok:
+            return sampled_points, sampled_normals, False
+        sampled_points[n] = point
+        sampled_normals[n] = normal
+    return sampled_points, sampled_normals, True
+
+
+@numba.njit(cache=True)
+def widest_run_center(mask):
+    """Return the center index of the widest run of True values, or -1 if there is none.
+
+    Ties are resolved in favor of the first run and even widths are rounded down.
+    """
+    best_start, best_width = -1, 0
+    start = -1
+    for i in range(mask.shape[0] + 1):
+        if i < mask.shape[0] and mask[i]:
+            if start < 0:
+                start = i
+        elif start >= 0:
+            if i - start > best_width:
+                best_start, best_width = start, i - start
+            start = -1
+    if best_width == 0:
+        return -1
+    return (2 * best_start + best_width - 1) // 2
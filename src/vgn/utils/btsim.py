@@ -271,6 +271,7 @@ class Camera(object):
         self.near = near
         self.far = far
         self.proj_matrix = _build_projection_matrix(intrinsic, near, far)
+        self.gl_proj_matrix = self.proj_matrix.flatten(order="F")
         self.p = physics_client
 
     def render(self, extrinsic):
@@ -279,25 +280,44 @@ class Camera(object):
         Args:
             extrinsic: Extrinsic parameters, T_cam_ref.
         """
-        # Construct OpenGL compatible view and projection matrices.
+        result = self._get_camera_image(extrinsic)
+        rgb, z_buffer = result[2][:, :, :3], result[3]
+        return rgb, self._to_depth(z_buffer)
+
+    def render_depth_images(self, extrinsics):
+        """Render synthetic depth images from several viewpoints back-to-back.
+
+        Args:
+            extrinsics: List of extrinsic parameters, T_cam_ref.
+
+        Returns:
+            Array of shape (n, height, width) with the depth images.
+        """
+        shape = (len(extrinsics), self.intrinsic.height, self.intrinsic.width)
+        depth_imgs = np.empty(shape, np.float32)
+        for i, extrinsic in enumerate(extrinsics):
+            depth_imgs[i] = self._to_depth(self._get_camera_image(extrinsic)[3])
+        return depth_imgs
+
+    def _get_camera_image(self, extrinsic):
+        # Construct OpenGL compatible view matrix.
         gl_view_matrix = extrinsic.as_matrix()
         gl_view_matrix[2, :] *= -1  # flip the Z axis
         gl_view_matrix = gl_view_matrix.flatten(order="F")
-        gl_proj_matrix = self.proj_matrix.flatten(order="F")
 
-        result = self.p.getCameraImage(
+        return self.p.getCameraImage(
             width=self.intrinsic.width,
             height=self.intrinsic.height,
             viewMatrix=gl_view_matrix,
-            projectionMatrix=gl_proj_matrix,
+            projectionMatrix=self.gl_proj_matrix,
             renderer=pybullet.ER_TINY_RENDERER,
+            flags=pybullet.ER_NO_SEGMENTATION_MASK,
         )
 
-        rgb, z_buffer = result[2][:, :, :3], result[3]
-        depth = (
+    def _to_depth(self, z_buffer):
+        return (
             1.0 * self.far * self.near / (self.far - (self.far - self.near) * z_buffer)
         )
-        return rgb, depth
 
 
 def _build_projection_matrix(intrinsic, near, far):
@@ -122,6 +122,29 @@ def to_cloud_msg(points, intensities=None, frame=None, stamp=None):
     return msg
 
 
+def from_depth_img_msg(msg, scale=0.001):
+    """Convert a depth Image message to a float32 depth image in meters.
+
+    Integer images (16UC1, mono16) are in millimeters and multiplied by scale,
+    32FC1 images are already in meters. The message buffer is viewed without
+    copying and cast and scaled in one pass.
+    """
+    if msg.encoding in ("16UC1", "mono16"):
+        dtype = np.dtype(np.uint16)
+    elif msg.encoding == "32FC1":
+        dtype, scale = np.dtype(np.float32), 1.0
+    else:
+        raise ValueError("Unsupported depth image encoding {}".format(msg.encoding))
+    dtype = dtype.newbyteorder(">" if msg.is_bigendian else "<")
+    depth = np.ndarray(
+        shape=(msg.height, msg.width),
+        dtype=dtype,
+        buffer=msg.data,
+        strides=(msg.step, dtype.itemsize),
+    )
+    return np.multiply(depth, scale, dtype=np.float32)
+
+
 class TransformTree(object):
     def __init__(self):
         self._buffer = tf2_ros.Buffer()